@@ -0,0 +1,56 @@
+"""
+Standalone post-game analysis worker
+
+Runs analysis jobs queued by /api/game/save outside the web process, e.g.
+to work through a backlog after peak hours. Safe to run alongside the
+in-process workers or several copies of itself - jobs are claimed atomically.
+
+Usage:
+    python analysis_worker.py            # run until stopped
+    python analysis_worker.py --drain    # process queued jobs, then exit
+"""
+import argparse
+import logging
+import os
+import sys
+import time
+
+# Add backend to path
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from app.models.game import init_db
+from app.services.analysis_queue import AnalysisQueue
+from app.services.claude_service import ClaudeCoachingService
+from app.services.quota_service import QuotaTracker
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--drain', action='store_true', help='exit once the queue is empty')
+    parser.add_argument('--workers', type=int, default=None, help='worker threads (default: ANALYSIS_WORKERS)')
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s %(threadName)s %(message)s')
+    init_db()
+
+    quota_tracker = QuotaTracker()
+    quota_tracker.start()
+    queue = AnalysisQueue(ClaudeCoachingService(usage_tracker=quota_tracker), workers=args.workers)
+
+    try:
+        if args.drain:
+            processed = queue.run_pending()
+            logging.info("Processed %d analysis jobs", processed)
+            return
+
+        queue.start()
+        logging.info("Analysis worker running with %d thread(s)", queue.workers)
+        try:
+            while True:
+                time.sleep(1)
+        except KeyboardInterrupt:
+            queue.stop()
+    finally:
+        quota_tracker.stop()
+
+if __name__ == '__main__':
+    main()
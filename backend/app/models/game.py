@@ -1,5 +1,5 @@
 from datetime import datetime
-from sqlalchemy import create_engine, Column, Integer, String, DateTime, Float
+from sqlalchemy import create_engine, Column, Integer, String, DateTime, Date, Float, UniqueConstraint
 from sqlalchemy.ext.declarative import declarative_base
 from sqlalchemy.orm import sessionmaker
 import os
@@ -39,6 +39,127 @@ class CoachingFeedback(Base):
     def __repr__(self):
         return f"<Feedback Game {self.game_id}, Move {self.move_number}>"
 
+class Player(Base):
+    __tablename__ = 'players'
+    
+    id = Column(Integer, primary_key=True)
+    name = Column(String, nullable=False, unique=True)
+    player_elo = Column(Integer, default=800)
+    coaching_intensity = Column(String, default="medium")  # low, medium, high
+    daily_token_quota = Column(Integer)  # LLM tokens per day; None = server default
+    created_at = Column(DateTime, default=datetime.utcnow)
+    
+    def to_dict(self):
+        return {
+            "id": self.id,
+            "name": self.name,
+            "player_elo": self.player_elo,
+            "coaching_intensity": self.coaching_intensity,
+            "daily_token_quota": self.daily_token_quota,
+            "created_at": self.created_at.isoformat() if self.created_at else None
+        }
+    
+    def __repr__(self):
+        return f"<Player {self.id}: {self.name} ({self.player_elo})>"
+
+class PlayerUsage(Base):
+    __tablename__ = 'player_usage'
+    __table_args__ = (UniqueConstraint('player_id', 'day'),)
+    
+    id = Column(Integer, primary_key=True)
+    player_id = Column(Integer, nullable=False, index=True)
+    day = Column(Date, nullable=False)  # UTC day the tokens were spent
+    tokens_used = Column(Integer, default=0)
+    request_count = Column(Integer, default=0)
+    
+    def __repr__(self):
+        return f"<Usage Player {self.player_id} on {self.day}: {self.tokens_used} tokens>"
+
+class AnalysisJob(Base):
+    __tablename__ = 'analysis_jobs'
+    
+    id = Column(Integer, primary_key=True)
+    game_id = Column(Integer, nullable=False, index=True)
+    player_id = Column(Integer)  # Charged for the LLM tokens, if set
+    player_elo = Column(Integer, default=800)
+    status = Column(String, default="queued", index=True)  # queued, running, done, failed
+    attempts = Column(Integer, default=0)
+    result = Column(String)  # Claude's post-game analysis
+    error = Column(String)
+    created_at = Column(DateTime, default=datetime.utcnow)
+    run_after = Column(DateTime)  # Retry backoff - not claimed before this time
+    started_at = Column(DateTime)
+    finished_at = Column(DateTime)
+    
+    def to_dict(self):
+        return {
+            "job_id": self.id,
+            "game_id": self.game_id,
+            "status": self.status,
+            "attempts": self.attempts,
+            "analysis": self.result,
+            "error": self.error,
+            "created_at": self.created_at.isoformat() if self.created_at else None,
+            "started_at": self.started_at.isoformat() if self.started_at else None,
+            "finished_at": self.finished_at.isoformat() if self.finished_at else None
+        }
+    
+    def __repr__(self):
+        return f"<AnalysisJob {self.id}: Game {self.game_id} {self.status}>"
+
+class PlayerDailyStats(Base):
+    """Per-player, per-day, per-color rollup - updated incrementally on each /save"""
+    __tablename__ = 'player_daily_stats'
+    __table_args__ = (UniqueConstraint('player_id', 'day', 'player_color'),)
+    
+    id = Column(Integer, primary_key=True)
+    player_id = Column(Integer, nullable=False, index=True)
+    day = Column(Date, nullable=False)
+    player_color = Column(String, nullable=False)  # "white" or "black"
+    games = Column(Integer, default=0)
+    wins = Column(Integer, default=0)
+    losses = Column(Integer, default=0)
+    draws = Column(Integer, default=0)
+    # Player's own moves and material-losing moves, by game phase
+    moves_opening = Column(Integer, default=0)
+    moves_middlegame = Column(Integer, default=0)
+    moves_endgame = Column(Integer, default=0)
+    blunders_opening = Column(Integer, default=0)
+    blunders_middlegame = Column(Integer, default=0)
+    blunders_endgame = Column(Integer, default=0)
+    
+    def __repr__(self):
+        return f"<DailyStats Player {self.player_id} {self.day} {self.player_color}: {self.games} games>"
+
+class PlayerOpeningStats(Base):
+    """Per-player results for each opening line - updated incrementally on each /save"""
+    __tablename__ = 'player_opening_stats'
+    __table_args__ = (UniqueConstraint('player_id', 'player_color', 'opening'),)
+    
+    id = Column(Integer, primary_key=True)
+    player_id = Column(Integer, nullable=False, index=True)
+    player_color = Column(String, nullable=False)
+    opening = Column(String, nullable=False)  # First few moves in SAN, e.g. "e4 e5 Nf3 Nc6"
+    games = Column(Integer, default=0)
+    wins = Column(Integer, default=0)
+    losses = Column(Integer, default=0)
+    draws = Column(Integer, default=0)
+    
+    def __repr__(self):
+        return f"<OpeningStats Player {self.player_id} {self.opening}: {self.games} games>"
+
+class PlayerGame(Base):
+    """Links a saved game to the player who played it, so rollups can be rebuilt"""
+    __tablename__ = 'player_games'
+    
+    id = Column(Integer, primary_key=True)
+    player_id = Column(Integer, nullable=False, index=True)
+    game_id = Column(Integer, nullable=False, unique=True)
+    created_at = Column(DateTime, default=datetime.utcnow)
+    
+    def __repr__(self):
+        return f"<PlayerGame Player {self.player_id}, Game {self.game_id}>"
+
 # Database setup
 engine = create_engine(os.getenv('DATABASE_URL', 'sqlite:///chess_coach.db'))
 SessionLocal = sessionmaker(bind=engine)
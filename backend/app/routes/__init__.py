@@ -15,6 +15,12 @@ def create_app():
     from app.routes.game_routes import game_bp
     app.register_blueprint(game_bp, url_prefix='/api/game')
     
+    # Start background post-game analysis workers (ANALYSIS_WORKERS=0 to disable)
+    from app.routes.game_routes import analysis_queue, quota_tracker
+    analysis_queue.start()
+    # Periodically flush batched token-usage counters
+    quota_tracker.start()
+    
     @app.route('/health', methods=['GET'])
     def health_check():
         return {"status": "healthy", "message": "Chess Coach API is running"}
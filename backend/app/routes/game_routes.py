@@ -1,14 +1,109 @@
+import atexit
+import logging
+import os
 from flask import Blueprint, request, jsonify
 from app.services.chess_service import ChessService
 from app.services.claude_service import ClaudeCoachingService
-from app.models.game import Game, CoachingFeedback, get_db, init_db
+from app.services.quota_service import QuotaTracker
+from app.services.analysis_queue import AnalysisQueue
+from app.services.analytics_service import AnalyticsService
+from app.services.llm_transport import ReplayMissError
+from app.models.game import Game, CoachingFeedback, Player, PlayerGame, get_db, init_db
+from app.utils.rate_limiter import RateLimiter
 
 # Create blueprint
 game_bp = Blueprint('game', __name__)
 
 # Initialize services immediately (they persist across requests)
 chess_service = ChessService()
-claude_service = ClaudeCoachingService()
+quota_tracker = QuotaTracker()
+claude_service = ClaudeCoachingService(usage_tracker=quota_tracker)
+# Post-game analysis runs off the request path; workers are started by run.py
+analysis_queue = AnalysisQueue(claude_service)
+analytics_service = AnalyticsService()
+
+logger = logging.getLogger(__name__)
+
+# Rate limits for routes that call the LLM (per worker process)
+player_limiter = RateLimiter(
+    requests_per_minute=int(os.getenv('RATE_LIMIT_PER_MINUTE', 20)),
+    burst=int(os.getenv('RATE_LIMIT_BURST', 5))
+)
+ip_limiter = RateLimiter(
+    requests_per_minute=int(os.getenv('IP_RATE_LIMIT_PER_MINUTE', 60)),
+    burst=int(os.getenv('IP_RATE_LIMIT_BURST', 10))
+)
+
+# Don't lose batched usage counters on shutdown
+atexit.register(quota_tracker.flush)
+
+VALID_INTENSITIES = ['low', 'medium', 'high']
+VALID_COLORS = ['white', 'black']
+
+@game_bp.errorhandler(ReplayMissError)
+def handle_replay_miss(e):
+    """Fail loudly when a replayed LLM call isn't in the cassette"""
+    logger.error("Replay miss: %s", e)
+    return jsonify({"success": False, "error": str(e)}), 500
+
+def _get_player(player_id):
+    """Load a player by id, or None if no id was given or it doesn't exist"""
+    if player_id is None:
+        return None
+    try:
+        player_id = int(player_id)
+    except (TypeError, ValueError):
+        return None
+    
+    db = get_db()
+    try:
+        return db.get(Player, player_id)
+    finally:
+        db.close()
+
+def _check_llm_limits(player):
+    """
+    Apply per-IP and per-player rate limits and the player's daily token quota
+    
+    Returns:
+        A (response, status) tuple if the request should be rejected, else None
+    """
+    allowed, retry_after = ip_limiter.check(f"ip:{request.remote_addr}")
+    if allowed and player is not None:
+        allowed, retry_after = player_limiter.check(f"player:{player.id}")
+    
+    if not allowed:
+        response = jsonify({
+            "success": False,
+            "error": "Too many requests. Please slow down.",
+            "retry_after": round(retry_after, 1)
+        })
+        response.headers['Retry-After'] = str(max(1, int(retry_after + 0.999)))
+        return response, 429
+    
+    if player is not None and quota_tracker.remaining(player.id, player.daily_token_quota) <= 0:
+        return jsonify({
+            "success": False,
+            "error": "Daily coaching quota reached. Please try again tomorrow."
+        }), 429
+    
+    return None
+
+def _resolve_player(data):
+    """
+    Look up the player referenced by `player_id` in the request body
+    
+    Returns:
+        (player, error) - error is a (response, status) tuple for an unknown id
+    """
+    player_id = data.get('player_id')
+    if player_id is None:
+        return None, None
+    
+    player = _get_player(player_id)
+    if player is None:
+        return None, (jsonify({"success": False, "error": "Player not found"}), 404)
+    return player, None
 
 @game_bp.route('/new', methods=['POST'])
 def new_game():
@@ -18,13 +113,15 @@ def new_game():
     player_color = data.get('player_color', 'white')
     opponent_name = data.get('opponent_name', 'Friend')
     
-    # Reset the chess board
-    chess_service.reset_board()
+    # Reset the chess board and snapshot it before another request can move
+    with chess_service.lock:
+        chess_service.reset_board()
+        board_state = chess_service.get_board_state()
     
     return jsonify({
         "success": True,
         "message": f"New game started. You are playing as {player_color}.",
-        "board_state": chess_service.get_board_state()
+        "board_state": board_state
     })
 
 @game_bp.route('/move', methods=['POST'])
@@ -36,41 +133,56 @@ def make_move():
     {
         "move": "e4",
         "coaching_intensity": "medium",  # optional
-        "player_elo": 800  # optional
+        "player_elo": 800,  # optional
+        "player_id": 1  # optional - uses stored preferences and quota
     }
     """
     
     data = request.get_json()
     move_str = data.get('move')
-    coaching_intensity = data.get('coaching_intensity', 'medium')
-    player_elo = data.get('player_elo', 800)
     
     if not move_str:
         return jsonify({"success": False, "error": "No move provided"}), 400
     
-    # Make the move
-    result = chess_service.make_move(move_str)
+    player, error = _resolve_player(data)
+    if error:
+        return error
     
-    if not result['success']:
-        return jsonify(result), 400
+    coaching_intensity = data.get('coaching_intensity', player.coaching_intensity if player else 'medium')
+    player_elo = data.get('player_elo', player.player_elo if player else 800)
     
-    # Get coaching feedback
-    game_phase = chess_service.get_game_phase()
-    move_history = chess_service.moves
+    limited = _check_llm_limits(player)
+    if limited:
+        return limited
     
+    # Make the move and snapshot the resulting state together, so a
+    # concurrent /move or /undo can't interleave. The lock is released
+    # before the (slow) coaching call.
+    with chess_service.lock:
+        result = chess_service.make_move(move_str)
+        
+        if not result['success']:
+            return jsonify(result), 400
+        
+        game_phase = chess_service.get_game_phase()
+        board_state = chess_service.get_board_state()
+    move_history = board_state['moves']
+    
+    # Get coaching feedback
     feedback = claude_service.get_coaching_feedback(
         move_san=result['move'],
         fen=result['fen'],
         game_phase=game_phase,
         player_elo=player_elo,
         coaching_intensity=coaching_intensity,
-        move_history=move_history
+        move_history=move_history,
+        player_id=player.id if player else None
     )
     
     return jsonify({
         "success": True,
         "move": result['move'],
-        "board_state": chess_service.get_board_state(),
+        "board_state": board_state,
         "coaching_feedback": feedback,
         "game_phase": game_phase,
         "is_check": result['is_check'],
@@ -87,58 +199,83 @@ def batch_moves():
     {
         "moves": ["e4", "e5", "Nf3", "Nc6"],
         "analyze_move": 2,  # Which move to analyze (1-indexed)
-        "player_elo": 800
+        "player_elo": 800,
+        "player_id": 1  # optional
     }
     """
     
     data = request.get_json()
     moves = data.get('moves', [])
     analyze_move_num = data.get('analyze_move')
-    player_elo = data.get('player_elo', 800)
     
     if not moves:
         return jsonify({"success": False, "error": "No moves provided"}), 400
     
-    results = []
-    for move in moves:
-        result = chess_service.make_move(move)
-        if not result['success']:
+    player, error = _resolve_player(data)
+    if error:
+        return error
+    
+    player_elo = data.get('player_elo', player.player_elo if player else 800)
+    
+    # Check limits up front so a rejected request doesn't leave moves applied
+    if analyze_move_num:
+        limited = _check_llm_limits(player)
+        if limited:
+            return limited
+    
+    # All-or-nothing: an invalid move rolls the whole batch back
+    with chess_service.lock:
+        batch = chess_service.make_moves(moves)
+        
+        if not batch['success']:
             return jsonify({
                 "success": False,
-                "error": f"Invalid move: {move}",
-                "results": results
+                "error": f"Invalid move: {batch['failed_move']}",
+                "failed_index": batch['failed_index'],
+                "board_state": chess_service.get_board_state()
             }), 400
-        results.append(result)
+        
+        game_phase = chess_service.get_game_phase()
+        board_state = chess_service.get_board_state()
+    
+    results = batch['results']
     
     # If specific move analysis requested
     feedback = None
     if analyze_move_num and 1 <= analyze_move_num <= len(moves):
         idx = analyze_move_num - 1
-        game_phase = chess_service.get_game_phase()
+        # History up to and including the analyzed move, from the start of the game
+        history_end = batch['start_index'] + idx + 1
         feedback = claude_service.get_coaching_feedback(
-            move_san=chess_service.moves[idx],
+            move_san=results[idx]['move'],
             fen=results[idx]['fen'],
             game_phase=game_phase,
             player_elo=player_elo,
             coaching_intensity="high",  # Detailed for batch analysis
-            move_history=chess_service.moves[:idx+1]
+            move_history=board_state['moves'][:history_end],
+            player_id=player.id if player else None
         )
     
     return jsonify({
         "success": True,
         "moves_played": len(moves),
-        "board_state": chess_service.get_board_state(),
+        "board_state": board_state,
         "coaching_feedback": feedback
     })
 
 @game_bp.route('/state', methods=['GET'])
 def get_state():
     """Get current board state"""
+    with chess_service.lock:
+        board_state = chess_service.get_board_state()
+        features = chess_service.get_position_features()
+        game_phase = chess_service.get_game_phase(features)
     
     return jsonify({
         "success": True,
-        "board_state": chess_service.get_board_state(),
-        "game_phase": chess_service.get_game_phase()
+        "board_state": board_state,
+        "game_phase": game_phase,
+        "position_features": features
     })
 
 @game_bp.route('/save', methods=['POST'])
@@ -150,7 +287,10 @@ def save_game():
     {
         "result": "1-0",  # or "0-1" or "1/2-1/2"
         "player_color": "white",
-        "opponent_name": "Friend"
+        "opponent_name": "Friend",
+        "analyze": true,  # optional - queue a post-game analysis (needs player_id)
+        "player_elo": 800,  # optional
+        "player_id": 1  # optional
     }
     """
     
@@ -158,14 +298,36 @@ def save_game():
     result = data.get('result')
     player_color = data.get('player_color', 'white')
     opponent_name = data.get('opponent_name', 'Friend')
+    analyze = data.get('analyze')
+    if analyze is None:
+        analyze = False
     
     if not result:
         return jsonify({"success": False, "error": "Game result required"}), 400
     
+    if player_color not in VALID_COLORS:
+        return jsonify({"success": False, "error": "player_color must be 'white' or 'black'"}), 400
+    
+    # Don't coerce: bool("false") is True
+    if not isinstance(analyze, bool):
+        return jsonify({"success": False, "error": "analyze must be true or false"}), 400
+    
+    player, error = _resolve_player(data)
+    if error:
+        return error
+    
+    # Analysis is an LLM call, so it has to be charged to a player's limits
+    if analyze and player is None:
+        return jsonify({"success": False, "error": "player_id required for analysis"}), 400
+    
+    player_elo = data.get('player_elo', player.player_elo if player else 800)
+    
     # Get PGN and final position
-    pgn = chess_service.get_pgn()
-    final_fen = chess_service.board.fen()
-    move_count = len(chess_service.moves)
+    with chess_service.lock:
+        pgn = chess_service.get_pgn()
+        final_fen = chess_service.board.fen()
+        moves = list(chess_service.moves)
+        move_count = len(moves)
     
     # Save to database
     db = get_db()
@@ -179,20 +341,55 @@ def save_game():
             move_count=move_count
         )
         db.add(game)
+        if player is not None:
+            # Same transaction as the game, so a linked game can always be re-scored
+            db.flush()
+            db.add(PlayerGame(player_id=player.id, game_id=game.id))
         db.commit()
         
         game_id = game.id
+        played_at = game.created_at
         db.close()
-        
-        return jsonify({
-            "success": True,
-            "message": "Game saved successfully",
-            "game_id": game_id
-        })
     except Exception as e:
         db.rollback()
         db.close()
         return jsonify({"success": False, "error": str(e)}), 500
+    
+    response = {
+        "success": True,
+        "message": "Game saved successfully",
+        "game_id": game_id
+    }
+    
+    # Keep the player's progress rollups current (one scoring pass per game)
+    if player is not None:
+        try:
+            analytics_service.record_game(player.id, moves, player_color, result, played_at=played_at)
+        except Exception:
+            # The game is saved and linked either way; POST
+            # /players/<id>/progress/rebuild recovers the missing stats
+            logger.exception("Could not update progress stats for game %s", game_id)
+    
+    if analyze:
+        limited = _check_llm_limits(player)
+        if limited:
+            # The game is saved; report why the analysis wasn't queued
+            body = limited[0].get_json()
+            response["analysis_error"] = f"{body['error']} Analysis not queued."
+            if "retry_after" in body:
+                response["retry_after"] = body["retry_after"]
+        else:
+            try:
+                response["analysis_job_id"] = analysis_queue.enqueue(
+                    game_id,
+                    player_elo=player_elo,
+                    player_id=player.id if player else None
+                )
+            except Exception as e:
+                # The game itself is saved; only the analysis couldn't be queued
+                response["analysis_error"] = str(e)
+    
+    return jsonify(response)
 
 @game_bp.route('/games', methods=['GET'])
 def get_games():
@@ -256,17 +453,22 @@ def set_coaching_intensity():
     
     Expected JSON:
     {
-        "intensity": "low"  # or "medium" or "high"
+        "intensity": "low",  # or "medium" or "high"
+        "player_id": 1  # optional - saves to the player's preferences
     }
     """
     data = request.get_json()
     intensity = data.get('intensity', 'medium')
     
-    if intensity not in ['low', 'medium', 'high']:
+    if intensity not in VALID_INTENSITIES:
         return jsonify({"success": False, "error": "Invalid intensity level"}), 400
     
-    # In a future version, this could save to user preferences
-    # For now, just acknowledge
+    player_id = data.get('player_id')
+    if player_id is not None:
+        player, error = _update_player(player_id, {"coaching_intensity": intensity})
+        if error:
+            return error
+    
     return jsonify({
         "success": True,
         "message": f"Coaching intensity set to {intensity}"
@@ -280,17 +482,21 @@ def undo_move():
     Returns:
         Updated board state after undoing the move
     """
-    result = chess_service.undo_last_move()
-    
-    if not result['success']:
-        return jsonify(result), 400
+    with chess_service.lock:
+        result = chess_service.undo_last_move()
+        
+        if not result['success']:
+            return jsonify(result), 400
+        
+        board_state = chess_service.get_board_state()
+        game_phase = chess_service.get_game_phase()
     
     return jsonify({
         "success": True,
         "message": result['message'],
         "undone_move": result['undone_move'],
-        "board_state": chess_service.get_board_state(),
-        "game_phase": chess_service.get_game_phase()
+        "board_state": board_state,
+        "game_phase": game_phase
     })
 
 @game_bp.route('/chat', methods=['POST'])
@@ -302,21 +508,32 @@ def chat():
     {
         "question": "Why was e4 a good move?",
         "recent_coaching": "e4 is a strong opening move...",  # optional
-        "player_elo": 800  # optional
+        "player_elo": 800,  # optional
+        "player_id": 1  # optional
     }
     """
     data = request.get_json()
     question = data.get('question')
     recent_coaching = data.get('recent_coaching', '')
-    player_elo = data.get('player_elo', 800)
     
     if not question:
         return jsonify({"success": False, "error": "No question provided"}), 400
     
+    player, error = _resolve_player(data)
+    if error:
+        return error
+    
+    player_elo = data.get('player_elo', player.player_elo if player else 800)
+    
+    limited = _check_llm_limits(player)
+    if limited:
+        return limited
+    
     # Get current game context
-    game_phase = chess_service.get_game_phase()
-    move_history = chess_service.moves
-    fen = chess_service.board.fen()
+    with chess_service.lock:
+        game_phase = chess_service.get_game_phase()
+        move_history = list(chess_service.moves)
+        fen = chess_service.board.fen()
     
     # Get AI response using Claude service
     response = claude_service.answer_question(
@@ -325,10 +542,222 @@ def chat():
         game_phase=game_phase,
         move_history=move_history,
         recent_coaching=recent_coaching,
-        player_elo=player_elo
+        player_elo=player_elo,
+        player_id=player.id if player else None
     )
     
     return jsonify({
         "success": True,
         "answer": response
-    })
\ No newline at end of file
+    })
+
+def _update_player(player_id, changes):
+    """
+    Apply preference changes to a stored player
+    
+    Returns:
+        (player_dict, error) - error is a (response, status) tuple
+    """
+    db = get_db()
+    try:
+        player = db.get(Player, int(player_id))
+        if player is None:
+            db.close()
+            return None, (jsonify({"success": False, "error": "Player not found"}), 404)
+        
+        for field, value in changes.items():
+            setattr(player, field, value)
+        db.commit()
+        
+        player_dict = player.to_dict()
+        db.close()
+        return player_dict, None
+    except (TypeError, ValueError):
+        db.close()
+        return None, (jsonify({"success": False, "error": "Invalid player id"}), 400)
+    except Exception as e:
+        db.rollback()
+        db.close()
+        return None, (jsonify({"success": False, "error": str(e)}), 500)
+
+def _validate_preferences(data):
+    """
+    Pull player_elo / coaching_intensity out of a request body
+    
+    Returns:
+        (changes, error_message)
+    """
+    changes = {}
+    
+    if 'player_elo' in data:
+        try:
+            changes['player_elo'] = int(data['player_elo'])
+        except (TypeError, ValueError):
+            return None, "player_elo must be a number"
+    
+    if 'coaching_intensity' in data:
+        if data['coaching_intensity'] not in VALID_INTENSITIES:
+            return None, "Invalid intensity level"
+        changes['coaching_intensity'] = data['coaching_intensity']
+    
+    return changes, None
+
+@game_bp.route('/players', methods=['POST'])
+def create_player():
+    """
+    Create a player profile with stored coaching preferences
+    
+    Expected JSON:
+    {
+        "name": "Alice",
+        "player_elo": 800,  # optional
+        "coaching_intensity": "medium"  # optional
+    }
+    """
+    data = request.get_json()
+    name = (data.get('name') or '').strip()
+    
+    if not name:
+        return jsonify({"success": False, "error": "Player name required"}), 400
+    
+    changes, error = _validate_preferences(data)
+    if error:
+        return jsonify({"success": False, "error": error}), 400
+    
+    db = get_db()
+    try:
+        if db.query(Player).filter(Player.name == name).first():
+            db.close()
+            return jsonify({"success": False, "error": "Player name already taken"}), 409
+        
+        player = Player(name=name, **changes)
+        db.add(player)
+        db.commit()
+        
+        player_dict = player.to_dict()
+        db.close()
+        
+        return jsonify({
+            "success": True,
+            "player": player_dict
+        }), 201
+    except Exception as e:
+        db.rollback()
+        db.close()
+        return jsonify({"success": False, "error": str(e)}), 500
+
+@game_bp.route('/players/<int:player_id>', methods=['GET'])
+def get_player(player_id):
+    """Get a player's profile, preferences and today's token usage"""
+    player = _get_player(player_id)
+    
+    if player is None:
+        return jsonify({"success": False, "error": "Player not found"}), 404
+    
+    quota = player.daily_token_quota
+    if quota is None:
+        quota = quota_tracker.default_daily_quota
+    
+    return jsonify({
+        "success": True,
+        "player": player.to_dict(),
+        "usage": {
+            "tokens_used_today": quota_tracker.used_today(player.id),
+            "daily_token_quota": quota,
+            "tokens_remaining": quota_tracker.remaining(player.id, quota)
+        }
+    })
+
+@game_bp.route('/players/<int:player_id>/progress', methods=['GET'])
+def get_player_progress(player_id):
+    """
+    Get a player's progress dashboard
+    
+    Query params:
+        period: "day", "week" (default) or "month" - blunder trend bucket
+        openings: Number of opening lines to return (default 10)
+    """
+    if _get_player(player_id) is None:
+        return jsonify({"success": False, "error": "Player not found"}), 404
+    
+    period = request.args.get('period', 'week')
+    if period not in ('day', 'week', 'month'):
+        return jsonify({"success": False, "error": "period must be day, week or month"}), 400
+    
+    try:
+        top_openings = max(1, min(int(request.args.get('openings', 10)), 50))
+    except ValueError:
+        return jsonify({"success": False, "error": "openings must be a number"}), 400
+    
+    return jsonify({
+        "success": True,
+        "progress": analytics_service.get_player_progress(player_id, period=period, top_openings=top_openings)
+    })
+
+@game_bp.route('/players/<int:player_id>/progress/rebuild', methods=['POST'])
+def rebuild_player_progress(player_id):
+    """Recompute a player's progress rollups from all of their saved games"""
+    if _get_player(player_id) is None:
+        return jsonify({"success": False, "error": "Player not found"}), 404
+    
+    try:
+        games = analytics_service.rebuild_player_stats(player_id)
+    except Exception as e:
+        return jsonify({"success": False, "error": str(e)}), 500
+    
+    return jsonify({
+        "success": True,
+        "games": games
+    })
+
+@game_bp.route('/players/<int:player_id>/preferences', methods=['POST'])
+def update_player_preferences(player_id):
+    """
+    Update a player's stored coaching preferences
+    
+    Expected JSON:
+    {
+        "player_elo": 950,  # optional
+        "coaching_intensity": "high"  # optional
+    }
+    """
+    data = request.get_json()
+    
+    changes, error = _validate_preferences(data)
+    if error:
+        return jsonify({"success": False, "error": error}), 400
+    
+    player_dict, error = _update_player(player_id, changes)
+    if error:
+        return error
+    
+    return jsonify({
+        "success": True,
+        "player": player_dict
+    })
+
+@game_bp.route('/analysis/<int:job_id>', methods=['GET'])
+def get_analysis_job(job_id):
+    """Get the status (and result, once done) of a post-game analysis job"""
+    job = analysis_queue.get_job(job_id)
+    
+    if job is None:
+        return jsonify({"success": False, "error": "Analysis job not found"}), 404
+    
+    return jsonify({
+        "success": True,
+        "job": job
+    })
+
+@game_bp.route('/games/<int:game_id>/analysis', methods=['GET'])
+def get_game_analysis(game_id):
+    """Get the latest post-game analysis for a saved game"""
+    job = analysis_queue.get_latest_for_game(game_id)
+    
+    if job is None:
+        return jsonify({"success": False, "error": "No analysis requested for this game"}), 404
+    
+    return jsonify({
+        "success": True,
+        "job": job
+    })
@@ -0,0 +1,271 @@
+import logging
+import os
+import threading
+from datetime import datetime, timedelta
+from dotenv import load_dotenv
+from sqlalchemy import or_
+from app.models.game import AnalysisJob, Game, get_db
+
+load_dotenv()
+
+logger = logging.getLogger(__name__)
+
+# Extra lease time on top of the LLM transport's worst case (DB work, scheduling)
+LEASE_MARGIN_SECONDS = 60
+
+class AnalysisQueue:
+    """
+    Durable queue of post-game analysis jobs, stored in the analysis_jobs table.
+
+    Jobs survive restarts because they live in the database. Workers claim a
+    job with a conditional UPDATE (status 'queued' -> 'running'), so several
+    threads or processes can share one queue without running a job twice.
+    Jobs left 'running' by a crashed worker are requeued once their lease
+    expires. The lease is always longer than the transport's worst-case call
+    time (timeout x attempts), so a slow call isn't handed to a second worker
+    and paid for twice; a worker whose job was requeued anyway can't
+    overwrite the newer attempt's outcome. Failed jobs are retried up to
+    `max_attempts` times, waiting `retry_delay` * attempts seconds between
+    tries.
+    """
+
+    def __init__(self, claude_service, workers=None, poll_interval=None,
+                 lease_seconds=None, max_attempts=3, retry_delay=None):
+        self.claude_service = claude_service
+        self.workers = workers if workers is not None else int(os.getenv('ANALYSIS_WORKERS', 1))
+        self.poll_interval = poll_interval if poll_interval is not None else float(os.getenv('ANALYSIS_POLL_INTERVAL', 2))
+        self.lease_seconds = self._lease_for(
+            claude_service,
+            lease_seconds if lease_seconds is not None else os.getenv('ANALYSIS_LEASE_SECONDS')
+        )
+        self.max_attempts = max_attempts
+        self.retry_delay = retry_delay if retry_delay is not None else float(os.getenv('ANALYSIS_RETRY_DELAY', 30))
+        self._stop = threading.Event()
+        self._wake = threading.Event()
+        self._threads = []
+
+    def enqueue(self, game_id, player_elo=800, player_id=None):
+        """
+        Add a post-game analysis job
+
+        Returns:
+            The new job's id
+        """
+        db = get_db()
+        try:
+            job = AnalysisJob(game_id=game_id, player_elo=player_elo, player_id=player_id)
+            db.add(job)
+            db.commit()
+            job_id = job.id
+        except Exception:
+            db.rollback()
+            raise
+        finally:
+            db.close()
+
+        self._wake.set()
+        return job_id
+
+    def get_job(self, job_id):
+        """Job status/result as a dict, or None"""
+        db = get_db()
+        try:
+            job = db.get(AnalysisJob, job_id)
+            return job.to_dict() if job else None
+        finally:
+            db.close()
+
+    def get_latest_for_game(self, game_id):
+        """Most recent job for a game as a dict, or None"""
+        db = get_db()
+        try:
+            job = db.query(AnalysisJob).filter(
+                AnalysisJob.game_id == game_id
+            ).order_by(AnalysisJob.id.desc()).first()
+            return job.to_dict() if job else None
+        finally:
+            db.close()
+
+    def start(self):
+        """Start background worker threads (no-op when workers is 0)"""
+        if self._threads or self.workers <= 0:
+            return
+
+        self._stop.clear()
+        for i in range(self.workers):
+            thread = threading.Thread(target=self._run, name=f"analysis-worker-{i}", daemon=True)
+            thread.start()
+            self._threads.append(thread)
+
+    def stop(self, timeout=None):
+        """Ask workers to exit after their current job and wait for them"""
+        self._stop.set()
+        self._wake.set()
+        for thread in self._threads:
+            thread.join(timeout)
+        self._threads = []
+
+    def run_pending(self):
+        """
+        Process jobs until the queue is empty
+
+        Returns:
+            Number of jobs processed
+        """
+        processed = 0
+        while not self._stop.is_set():
+            job_id = self.claim_next()
+            if job_id is None:
+                break
+            self.process(job_id)
+            processed += 1
+        return processed
+
+    def claim_next(self):
+        """
+        Atomically claim the oldest queued job
+
+        Returns:
+            The claimed job id, or None if nothing is queued
+        """
+        self._requeue_expired()
+
+        db = get_db()
+        try:
+            while True:
+                candidate = db.query(AnalysisJob.id).filter(
+                    AnalysisJob.status == "queued",
+                    or_(AnalysisJob.run_after.is_(None), AnalysisJob.run_after <= datetime.utcnow())
+                ).order_by(AnalysisJob.id).first()
+                if candidate is None:
+                    return None
+
+                claimed = db.query(AnalysisJob).filter(
+                    AnalysisJob.id == candidate.id,
+                    AnalysisJob.status == "queued"
+                ).update({
+                    AnalysisJob.status: "running",
+                    AnalysisJob.started_at: datetime.utcnow(),
+                    AnalysisJob.attempts: AnalysisJob.attempts + 1
+                }, synchronize_session=False)
+                db.commit()
+
+                if claimed:
+                    return candidate.id
+                # Another worker got it first - try the next one
+        finally:
+            db.close()
+
+    def process(self, job_id):
+        """Run the analysis for a claimed job and store the outcome"""
+        db = get_db()
+        try:
+            job = db.get(AnalysisJob, job_id)
+            attempt = job.attempts
+            game = db.get(Game, job.game_id)
+            if game is None:
+                self._finish(db, job_id, attempt, error=f"Game {job.game_id} not found", retry=False)
+                return
+
+            pgn, result, player_color = game.pgn, game.result, game.player_color
+            player_elo, player_id = job.player_elo, job.player_id
+            # Don't hold a connection during the (slow) LLM call
+            db.close()
+
+            try:
+                analysis = self.claude_service.analyze_game(
+                    pgn=pgn,
+                    result=result,
+                    player_color=player_color,
+                    player_elo=player_elo,
+                    player_id=player_id,
+                    raise_errors=True
+                )
+            except Exception as e:
+                logger.warning("Analysis job %s failed: %s", job_id, e)
+                db = get_db()
+                self._finish(db, job_id, attempt, error=str(e), retry=attempt < self.max_attempts)
+                return
+
+            db = get_db()
+            self._finish(db, job_id, attempt, result=analysis)
+        finally:
+            db.close()
+
+    def _finish(self, db, job_id, attempt, result=None, error=None, retry=False):
+        """
+        Store the outcome of one attempt
+
+        Only writes if the job is still running this attempt - if its lease
+        expired and it was requeued or claimed again, the outcome is dropped.
+
+        Returns:
+            True if the outcome was stored
+        """
+        now = datetime.utcnow()
+        if error is None:
+            values = {AnalysisJob.status: "done", AnalysisJob.result: result, AnalysisJob.error: None}
+        elif retry:
+            values = {
+                AnalysisJob.status: "queued",
+                AnalysisJob.error: error,
+                AnalysisJob.run_after: now + timedelta(seconds=self.retry_delay * attempt)
+            }
+        else:
+            values = {AnalysisJob.status: "failed", AnalysisJob.error: error}
+        values[AnalysisJob.finished_at] = now
+
+        updated = db.query(AnalysisJob).filter(
+            AnalysisJob.id == job_id,
+            AnalysisJob.status == "running",
+            AnalysisJob.attempts == attempt
+        ).update(values, synchronize_session=False)
+        db.commit()
+
+        if not updated:
+            logger.warning("Analysis job %s attempt %s lost its lease; dropping its outcome", job_id, attempt)
+        return bool(updated)
+
+    @staticmethod
+    def _lease_for(claude_service, configured):
+        """Lease length that outlasts the slowest possible LLM call"""
+        transport = getattr(claude_service, "transport", None)
+        minimum = getattr(transport, "worst_case_seconds", 0) + LEASE_MARGIN_SECONDS
+        if configured in (None, ''):
+            return minimum
+
+        configured = float(configured)
+        if configured < minimum:
+            logger.warning("Analysis lease of %ss is shorter than the LLM transport's worst case; using %ss",
+                           configured, minimum)
+            return minimum
+        return configured
+
+    def _requeue_expired(self):
+        """Put jobs back in the queue if their worker died mid-run"""
+        cutoff = datetime.utcnow() - timedelta(seconds=self.lease_seconds)
+        db = get_db()
+        try:
+            expired = db.query(AnalysisJob).filter(
+                AnalysisJob.status == "running",
+                AnalysisJob.started_at < cutoff
+            )
+            expired.filter(AnalysisJob.attempts < self.max_attempts).update(
+                {AnalysisJob.status: "queued"}, synchronize_session=False
+            )
+            expired.filter(AnalysisJob.attempts >= self.max_attempts).update(
+                {AnalysisJob.status: "failed", AnalysisJob.error: "Worker lease expired"},
+                synchronize_session=False
+            )
+            db.commit()
+        finally:
+            db.close()
+
+    def _run(self):
+        while not self._stop.is_set():
+            try:
+                self.run_pending()
+            except Exception:
+                logger.exception("Analysis worker error")
+            self._wake.wait(self.poll_interval)
+            self._wake.clear()
@@ -0,0 +1,366 @@
+import io
+import logging
+import chess
+import chess.pgn
+import numpy as np
+from datetime import datetime
+from sqlalchemy.exc import IntegrityError
+from app.models.game import Game, PlayerDailyStats, PlayerGame, PlayerOpeningStats, get_db
+from app.utils.position_features import (
+    FEATURE_NAMES, PHASES, classify_phase_batch, extract_features_batch
+)
+
+# Moves (plies) that make up the "opening line" key
+OPENING_PLIES = 6
+# Losing this much material (in pawns, once the exchange has settled) counts as a blunder
+BLUNDER_THRESHOLD = 3
+
+DAILY_COUNTERS = [
+    "games", "wins", "losses", "draws",
+    "moves_opening", "moves_middlegame", "moves_endgame",
+    "blunders_opening", "blunders_middlegame", "blunders_endgame",
+]
+OPENING_COUNTERS = ["games", "wins", "losses", "draws"]
+
+logger = logging.getLogger(__name__)
+
+class AnalyticsService:
+    """
+    Player progress analytics backed by materialized rollup tables.
+
+    Each saved game is scored once, at /save time, and added to
+    player_daily_stats (per day and color) and player_opening_stats (per
+    opening line). Dashboard queries then read a few rows per day of history
+    and aggregate them with NumPy, so they don't slow down as the number of
+    games grows and never re-parse PGNs. Games are linked to players in
+    player_games, so rebuild_player_stats() can recompute the rollups if an
+    update was lost.
+
+    Without an engine, move quality is a material proxy: a player's move is a
+    blunder if it is still BLUNDER_THRESHOLD pawns of material or more down
+    after the player's next move (so a recapture settles an even trade), or
+    if it allows mate. "Accuracy" is the share of moves that aren't blunders.
+    """
+
+    def summarize_game(self, moves, player_color, result):
+        """
+        Score one game
+
+        Args:
+            moves: List of moves in SAN, from the starting position
+            player_color: "white" or "black"
+            result: "1-0", "0-1", "1/2-1/2" (anything else counts as unfinished)
+
+        Returns:
+            dict with outcome, opening line and per-phase move/blunder counts
+        """
+        if player_color not in ("white", "black"):
+            raise ValueError(f"Unknown player_color: {player_color} (expected white or black)")
+
+        board = chess.Board()
+        positions = [board.copy(stack=False)]
+        for san in moves:
+            board.push_san(san)
+            positions.append(board.copy(stack=False))
+
+        # One vectorized pass over every position in the game
+        features = extract_features_batch(positions)
+        phases = classify_phase_batch(features, [p.fullmove_number for p in positions])
+
+        sign = 1 if player_color == "white" else -1
+        balance = sign * features[:, FEATURE_NAMES.index("material_balance")]
+
+        # The player's moves are the plies made from positions where it was their turn
+        first_ply = 0 if player_color == "white" else 1
+        plies = np.arange(first_ply, len(moves), 2)
+        # Material swing from before the move to after the player's next move,
+        # so an even trade the opponent starts is settled by the recapture
+        settled = np.minimum(plies + 3, len(positions) - 1)
+        swing = balance[settled] - balance[plies]
+        blunders = swing <= -BLUNDER_THRESHOLD
+        # Walking into mate loses no material but is the worst move of all
+        player_turn = chess.WHITE if player_color == "white" else chess.BLACK
+        if len(plies) and board.is_checkmate() and board.turn == player_turn:
+            blunders[-1] = True
+
+        summary = {
+            "outcome": self._outcome(result, player_color),
+            "opening": " ".join(moves[:OPENING_PLIES]),
+        }
+        ply_phases = phases[plies]
+        for index, phase in enumerate(PHASES):
+            in_phase = ply_phases == index
+            summary[f"moves_{phase}"] = int(in_phase.sum())
+            summary[f"blunders_{phase}"] = int((blunders & in_phase).sum())
+        return summary
+
+    def record_game(self, player_id, moves, player_color, result, played_at=None):
+        """
+        Add a saved game to the player's rollups
+
+        Args:
+            player_id: Player the game belongs to
+            moves: List of moves in SAN
+            player_color: "white" or "black"
+            result: Game result string
+            played_at: When the game was saved (defaults to now, UTC)
+        """
+        summary = self.summarize_game(moves, player_color, result)
+        day = (played_at or datetime.utcnow()).date()
+        daily, opening = self._increments(summary)
+
+        # A concurrent /save may insert the same rollup row first; retry once as an update
+        for attempt in range(2):
+            db = get_db()
+            try:
+                self._increment(db, PlayerDailyStats, {
+                    "player_id": player_id, "day": day, "player_color": player_color
+                }, daily)
+                if summary["opening"]:
+                    self._increment(db, PlayerOpeningStats, {
+                        "player_id": player_id, "player_color": player_color, "opening": summary["opening"]
+                    }, opening)
+                db.commit()
+                return summary
+            except IntegrityError:
+                db.rollback()
+                if attempt:
+                    raise
+            finally:
+                db.close()
+
+    def rebuild_player_stats(self, player_id):
+        """
+        Recompute a player's rollups from scratch from their linked games
+
+        Recovers stats lost when record_game failed after a /save. Games that
+        can't be scored (unreadable PGN, unknown color) are skipped.
+
+        Returns:
+            Number of games scored
+        """
+        db = get_db()
+        try:
+            games = db.query(
+                Game.id, Game.pgn, Game.player_color, Game.result, Game.created_at
+            ).join(
+                PlayerGame, PlayerGame.game_id == Game.id
+            ).filter(
+                PlayerGame.player_id == player_id
+            ).order_by(Game.id).all()
+        finally:
+            db.close()
+
+        daily_rows, opening_rows = {}, {}
+        scored = 0
+        for game_id, pgn, player_color, result, created_at in games:
+            try:
+                summary = self.summarize_game(self._moves_from_pgn(pgn), player_color, result)
+            except ValueError as e:
+                logger.warning("Skipping game %s in stats rebuild: %s", game_id, e)
+                continue
+
+            daily, opening = self._increments(summary)
+            self._accumulate(daily_rows, (created_at.date(), player_color), DAILY_COUNTERS, daily)
+            if summary["opening"]:
+                self._accumulate(opening_rows, (player_color, summary["opening"]), OPENING_COUNTERS, opening)
+            scored += 1
+
+        # Swap the old rows for the new ones in a single transaction
+        db = get_db()
+        try:
+            db.query(PlayerDailyStats).filter(
+                PlayerDailyStats.player_id == player_id
+            ).delete(synchronize_session=False)
+            db.query(PlayerOpeningStats).filter(
+                PlayerOpeningStats.player_id == player_id
+            ).delete(synchronize_session=False)
+            db.add_all([
+                PlayerDailyStats(player_id=player_id, day=day, player_color=color, **counts)
+                for (day, color), counts in daily_rows.items()
+            ])
+            db.add_all([
+                PlayerOpeningStats(player_id=player_id, player_color=color, opening=opening, **counts)
+                for (color, opening), counts in opening_rows.items()
+            ])
+            db.commit()
+        except Exception:
+            db.rollback()
+            raise
+        finally:
+            db.close()
+
+        return scored
+
+    def get_player_progress(self, player_id, period="week", top_openings=10):
+        """
+        Dashboard data for one player
+
+        Args:
+            player_id: Player to report on
+            period: Trend bucket - "day", "week" or "month"
+            top_openings: How many opening lines to return
+
+        Returns:
+            dict with results by color, accuracy by phase, a blunder-rate
+            trend and the most common opening lines
+        """
+        db = get_db()
+        try:
+            rows = db.query(
+                PlayerDailyStats.day,
+                PlayerDailyStats.player_color,
+                *[getattr(PlayerDailyStats, name) for name in DAILY_COUNTERS]
+            ).filter(
+                PlayerDailyStats.player_id == player_id
+            ).order_by(PlayerDailyStats.day).all()
+
+            openings = db.query(PlayerOpeningStats).filter(
+                PlayerOpeningStats.player_id == player_id
+            ).order_by(PlayerOpeningStats.games.desc()).limit(top_openings).all()
+            opening_list = [{
+                "opening": o.opening,
+                "color": o.player_color,
+                "games": o.games,
+                "wins": o.wins,
+                "losses": o.losses,
+                "draws": o.draws,
+                "win_rate": self._rate(o.wins, o.games)
+            } for o in openings]
+        finally:
+            db.close()
+
+        # Columnar view of the rollups: one row per (day, color)
+        days = np.array([row[0] for row in rows], dtype="datetime64[D]")
+        colors = np.array([row[1] for row in rows])
+        counts = np.array([row[2:] for row in rows], dtype=np.int64).reshape(len(rows), len(DAILY_COUNTERS))
+        col = {name: i for i, name in enumerate(DAILY_COUNTERS)}
+
+        results_by_color = {}
+        for color in ("white", "black"):
+            totals = counts[colors == color].sum(axis=0)
+            results_by_color[color] = {
+                "games": int(totals[col["games"]]),
+                "wins": int(totals[col["wins"]]),
+                "losses": int(totals[col["losses"]]),
+                "draws": int(totals[col["draws"]]),
+                "win_rate": self._rate(totals[col["wins"]], totals[col["games"]])
+            }
+
+        totals = counts.sum(axis=0)
+        accuracy_by_phase = {
+            phase: {
+                "moves": int(totals[col[f"moves_{phase}"]]),
+                "blunders": int(totals[col[f"blunders_{phase}"]]),
+                "accuracy": self._accuracy(totals[col[f"blunders_{phase}"]], totals[col[f"moves_{phase}"]])
+            }
+            for phase in PHASES
+        }
+
+        return {
+            "player_id": player_id,
+            "results_by_color": results_by_color,
+            "accuracy_by_phase": accuracy_by_phase,
+            "blunder_trend": self._trend(days, counts, col, period),
+            "top_openings": opening_list
+        }
+
+    def _trend(self, days, counts, col, period):
+        """Games, win rate and blunder rate per period"""
+        if len(days) == 0:
+            return []
+
+        buckets = self._bucket_starts(days, period)
+        labels, inverse = np.unique(buckets, return_inverse=True)
+        per_bucket = np.zeros((len(labels), counts.shape[1]), dtype=np.int64)
+        np.add.at(per_bucket, inverse, counts)
+
+        moves = sum(per_bucket[:, col[f"moves_{phase}"]] for phase in PHASES)
+        blunders = sum(per_bucket[:, col[f"blunders_{phase}"]] for phase in PHASES)
+
+        return [{
+            "period_start": str(label),
+            "games": int(per_bucket[i, col["games"]]),
+            "win_rate": self._rate(per_bucket[i, col["wins"]], per_bucket[i, col["games"]]),
+            "moves": int(moves[i]),
+            "blunders": int(blunders[i]),
+            "blunder_rate": self._rate(blunders[i], moves[i])
+        } for i, label in enumerate(labels)]
+
+    @staticmethod
+    def _bucket_starts(days, period):
+        if period == "day":
+            return days
+        if period == "month":
+            return days.astype("datetime64[M]").astype("datetime64[D]")
+        if period == "week":
+            # Day 0 of datetime64 (1970-01-01) was a Thursday; shift to Monday-start weeks
+            weekday = (days.astype(np.int64) + 3) % 7
+            return days - weekday.astype("timedelta64[D]")
+        raise ValueError(f"Unknown period: {period} (expected day, week or month)")
+
+    @staticmethod
+    def _moves_from_pgn(pgn):
+        """SAN moves of a PGN's main line (ValueError if it can't be read)"""
+        game = chess.pgn.read_game(io.StringIO(pgn or ""))
+        if game is None or game.errors:
+            raise ValueError("Unreadable PGN")
+
+        board = game.board()
+        moves = []
+        for move in game.mainline_moves():
+            moves.append(board.san(move))
+            board.push(move)
+        return moves
+
+    @staticmethod
+    def _increments(summary):
+        """Daily and opening rollup increments for one scored game"""
+        outcome = summary["outcome"]
+        daily = {
+            "games": 1,
+            "wins": int(outcome == "win"),
+            "losses": int(outcome == "loss"),
+            "draws": int(outcome == "draw"),
+        }
+        for phase in PHASES:
+            daily[f"moves_{phase}"] = summary[f"moves_{phase}"]
+            daily[f"blunders_{phase}"] = summary[f"blunders_{phase}"]
+
+        opening = {key: daily[key] for key in OPENING_COUNTERS}
+        return daily, opening
+
+    @staticmethod
+    def _accumulate(rows, key, counters, increments):
+        counts = rows.setdefault(key, dict.fromkeys(counters, 0))
+        for name, value in increments.items():
+            counts[name] += value
+
+    @staticmethod
+    def _increment(db, model, keys, increments):
+        """Add to an existing rollup row, or create it"""
+        query = db.query(model).filter_by(**keys)
+        updated = query.update({
+            getattr(model, name): getattr(model, name) + value
+            for name, value in increments.items()
+        }, synchronize_session=False)
+        if not updated:
+            db.add(model(**keys, **increments))
+            db.flush()
+
+    @staticmethod
+    def _outcome(result, player_color):
+        if result == "1/2-1/2":
+            return "draw"
+        if result in ("1-0", "0-1"):
+            won = (result == "1-0") == (player_color == "white")
+            return "win" if won else "loss"
+        return None
+
+    @staticmethod
+    def _rate(part, whole):
+        return round(float(part) / float(whole) * 100, 1) if whole else 0
+
+    @staticmethod
+    def _accuracy(blunders, moves):
+        return round((1 - float(blunders) / float(moves)) * 100, 1) if moves else None
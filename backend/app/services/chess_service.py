@@ -1,17 +1,23 @@
 import chess
 import chess.pgn
+import threading
 from io import StringIO
 from datetime import datetime
+from app.utils.position_features import extract_features, classify_phase
 
 class ChessService:
     def __init__(self):
         self.board = chess.Board()
         self.moves = []  # List of moves in SAN notation
+        # Guards board + moves. Reentrant so routes can hold it across several
+        # calls (e.g. move, then read phase and state) for a consistent view
+        self.lock = threading.RLock()
         
     def reset_board(self):
         """Start a new game"""
-        self.board = chess.Board()
-        self.moves = []
+        with self.lock:
+            self.board = chess.Board()
+            self.moves = []
         
     def make_move(self, move_str):
         """
@@ -23,6 +29,47 @@ class ChessService:
         Returns:
             dict with move info or error
         """
+        with self.lock:
+            return self._make_move(move_str)
+    
+    def make_moves(self, move_strs):
+        """
+        Apply several moves atomically - either all of them or none
+        
+        Args:
+            move_strs: List of moves in SAN or UCI
+        
+        Returns:
+            dict with per-move results, or an error after rolling the board
+            back to where it was before the batch
+        """
+        with self.lock:
+            start = len(self.moves)
+            results = []
+            
+            for index, move_str in enumerate(move_strs):
+                result = self._make_move(move_str)
+                if not result['success']:
+                    # Roll back everything this batch applied
+                    for _ in range(len(results)):
+                        self.board.pop()
+                        self.moves.pop()
+                    return {
+                        "success": False,
+                        "error": result['error'],
+                        "failed_index": index,
+                        "failed_move": move_str
+                    }
+                results.append(result)
+            
+            return {
+                "success": True,
+                "start_index": start,
+                "results": results
+            }
+    
+    def _make_move(self, move_str):
+        # Caller must hold self.lock
         try:
             # Try parsing as SAN first
             move = self.board.parse_san(move_str)
@@ -53,19 +100,23 @@ class ChessService:
     
     def get_board_state(self):
         """Get current board state"""
-        return {
-            "fen": self.board.fen(),
-            "turn": "white" if self.board.turn else "black",
-            "move_number": len(self.moves),
-            "moves": self.moves,
-            "is_check": self.board.is_check(),
-            "is_checkmate": self.board.is_checkmate(),
-            "is_stalemate": self.board.is_stalemate(),
-            "is_game_over": self.board.is_game_over()
-        }
+        with self.lock:
+            return {
+                "fen": self.board.fen(),
+                "turn": "white" if self.board.turn else "black",
+                "move_number": len(self.moves),
+                "moves": list(self.moves),
+                "is_check": self.board.is_check(),
+                "is_checkmate": self.board.is_checkmate(),
+                "is_stalemate": self.board.is_stalemate(),
+                "is_game_over": self.board.is_game_over()
+            }
     
     def get_pgn(self):
         """Export game as PGN string"""
+        with self.lock:
+            moves = list(self.moves)
+        
         game = chess.pgn.Game()
         game.headers["Event"] = "Chess Coach Training"
         game.headers["Date"] = datetime.now().strftime("%Y.%m.%d")
@@ -73,7 +124,7 @@ class ChessService:
         node = game
         temp_board = chess.Board()
         
-        for move_san in self.moves:
+        for move_san in moves:
             move = temp_board.parse_san(move_san)
             node = node.add_variation(move)
             temp_board.push(move)
@@ -84,22 +135,28 @@ class ChessService:
     def load_from_fen(self, fen):
         """Load a specific board position"""
         try:
-            self.board = chess.Board(fen)
-            return {"success": True, "fen": fen}
+            board = chess.Board(fen)
         except ValueError as e:
             return {"success": False, "error": str(e)}
+        
+        with self.lock:
+            self.board = board
+        return {"success": True, "fen": fen}
+    
+    def get_position_features(self):
+        """Material, phase, pawn structure, king safety and mobility for the current position"""
+        with self.lock:
+            board = self.board.copy(stack=False)
+        return extract_features(board)
     
-    def get_game_phase(self):
+    def get_game_phase(self, features=None):
         """Determine if we're in opening, middlegame, or endgame"""
-        move_count = len(self.moves)
-        piece_count = len(self.board.piece_map())
+        with self.lock:
+            board = self.board.copy(stack=False)
         
-        if move_count < 10:
-            return "opening"
-        elif piece_count <= 12:  # Few pieces left
-            return "endgame"
-        else:
-            return "middlegame"
+        if features is None:
+            features = extract_features(board)
+        return classify_phase(features, board.fullmove_number)
     
     def undo_last_move(self):
         """
@@ -108,27 +165,28 @@ class ChessService:
         Returns:
             dict with success status and new board state
         """
-        if len(self.moves) == 0:
-            return {
-                "success": False,
-                "error": "No moves to undo"
-            }
-        
-        try:
-            # Pop the last move from python-chess board
-            self.board.pop()
-            # Remove last move from our tracking list
-            undone_move = self.moves.pop()
+        with self.lock:
+            if len(self.moves) == 0:
+                return {
+                    "success": False,
+                    "error": "No moves to undo"
+                }
             
-            return {
-                "success": True,
-                "undone_move": undone_move,
-                "fen": self.board.fen(),
-                "move_count": len(self.moves),
-                "message": f"Undid move: {undone_move}"
-            }
-        except Exception as e:
-            return {
-                "success": False,
-                "error": f"Could not undo move: {str(e)}"
-            }
+            try:
+                # Pop the last move from python-chess board
+                self.board.pop()
+                # Remove last move from our tracking list
+                undone_move = self.moves.pop()
+                
+                return {
+                    "success": True,
+                    "undone_move": undone_move,
+                    "fen": self.board.fen(),
+                    "move_count": len(self.moves),
+                    "message": f"Undid move: {undone_move}"
+                }
+            except Exception as e:
+                return {
+                    "success": False,
+                    "error": f"Could not undo move: {str(e)}"
+                }
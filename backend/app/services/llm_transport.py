@@ -0,0 +1,318 @@
+"""
+Pluggable transports for ClaudeCoachingService.
+
+- LiveTransport calls the Anthropic API.
+- RecordingTransport wraps another transport and saves every
+  request/response pair to a cassette file.
+- ReplayTransport answers from a cassette without touching the network,
+  with optional injected latency and errors for load tests.
+
+Pick one with the LLM_TRANSPORT env var ("live", "record" or "replay") and
+point LLM_CASSETTE at the cassette file.
+"""
+import gzip
+import hashlib
+import json
+import logging
+import os
+import random
+import threading
+import time
+import zlib
+from datetime import datetime
+import anthropic
+from dotenv import load_dotenv
+
+load_dotenv()
+
+logger = logging.getLogger(__name__)
+
+# Longest the Anthropic SDK waits between retries (it honors Retry-After up to 60s)
+MAX_RETRY_WAIT = 60
+
+def prompt_key(model, prompt, max_tokens):
+    """Stable cassette key for a request"""
+    digest = hashlib.sha256(f"{model}\0{max_tokens}\0{prompt}".encode("utf-8"))
+    return digest.hexdigest()[:32]
+
+class ReplayMissError(LookupError):
+    """
+    Raised when a replayed request has no recording in the cassette.
+
+    ClaudeCoachingService lets this through its catch-all handlers, so a
+    replay run against the wrong cassette fails instead of passing quietly.
+    """
+
+class InjectedTransportError(RuntimeError):
+    """Raised by ReplayTransport to simulate an API failure"""
+
+class CassetteStore:
+    """
+    Append-only JSON-lines file of recorded LLM calls, keyed by prompt hash.
+
+    Only the prompt hash and size are stored, not the prompt text, which keeps
+    cassettes small. Paths ending in .gz are gzip-compressed. If the same
+    prompt was recorded more than once, the newest entry wins.
+
+    A damaged file (e.g. a truncated tail from an interrupted append) is
+    rewritten on load with the entries that could be read, so later appends
+    don't land after broken bytes.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self.entries = {}
+        self._lock = threading.Lock()
+        self._load()
+
+    def _open(self, mode, path=None):
+        # Compression follows the cassette's name, also for its temp file
+        path = path or self.path
+        if self.path.endswith(".gz"):
+            return gzip.open(path, mode + "t", encoding="utf-8")
+        return open(path, mode, encoding="utf-8")
+
+    def _load(self):
+        if not os.path.exists(self.path):
+            return
+
+        damaged = None
+        try:
+            with self._open("r") as f:
+                for line in f:
+                    line = line.strip()
+                    if not line:
+                        continue
+                    try:
+                        entry = json.loads(line)
+                    except json.JSONDecodeError as e:
+                        # A partial record from an interrupted append; keep reading
+                        damaged = e
+                        continue
+                    self.entries[entry["key"]] = entry
+        except (EOFError, gzip.BadGzipFile, zlib.error, UnicodeDecodeError) as e:
+            # A truncated or corrupt gzip member; keep everything read before it
+            damaged = e
+
+        if damaged is None and not self.path.endswith(".gz") and not self._ends_with_newline():
+            # The next append would be glued onto the last record
+            damaged = "missing final newline"
+
+        if damaged is not None:
+            logger.warning("Cassette %s is damaged (%s); rewriting it with %d readable entries",
+                           self.path, damaged, len(self.entries))
+            self._rewrite()
+
+    def _ends_with_newline(self):
+        with open(self.path, "rb") as f:
+            f.seek(0, os.SEEK_END)
+            if f.tell() == 0:
+                return True
+            f.seek(-1, os.SEEK_END)
+            return f.read(1) == b"\n"
+
+    def _rewrite(self):
+        """Replace the file with a clean copy of the loaded entries"""
+        tmp_path = self.path + ".tmp"
+        with self._open("w", tmp_path) as f:
+            for entry in self.entries.values():
+                f.write(json.dumps(entry, separators=(",", ":")) + "\n")
+        os.replace(tmp_path, self.path)
+
+    def get(self, key):
+        return self.entries.get(key)
+
+    def add(self, entry):
+        """Save one entry, both in memory and on disk"""
+        with self._lock:
+            self.entries[entry["key"]] = entry
+            directory = os.path.dirname(self.path)
+            if directory:
+                os.makedirs(directory, exist_ok=True)
+            with self._open("a") as f:
+                f.write(json.dumps(entry, separators=(",", ":")) + "\n")
+
+    def __len__(self):
+        return len(self.entries)
+
+class LiveTransport:
+    """
+    Sends prompts to the Anthropic Messages API
+
+    Args:
+        api_key: Defaults to ANTHROPIC_API_KEY
+        timeout: Seconds per HTTP attempt (LLM_TIMEOUT, default 120)
+        max_retries: Retries after a failed attempt (LLM_MAX_RETRIES, default 2)
+    """
+
+    def __init__(self, api_key=None, timeout=None, max_retries=None):
+        self.timeout = timeout if timeout is not None else float(os.getenv('LLM_TIMEOUT', 120))
+        self.max_retries = max_retries if max_retries is not None else int(os.getenv('LLM_MAX_RETRIES', 2))
+        self.client = anthropic.Anthropic(
+            api_key=api_key or os.getenv('ANTHROPIC_API_KEY'),
+            timeout=self.timeout,
+            max_retries=self.max_retries
+        )
+
+    @property
+    def worst_case_seconds(self):
+        """Longest a single send() can take, counting every retry"""
+        return self.timeout * (self.max_retries + 1) + MAX_RETRY_WAIT * self.max_retries
+
+    def send(self, model, prompt, max_tokens):
+        """
+        Send a single-turn prompt
+
+        Returns:
+            dict with "text", "input_tokens" and "output_tokens"
+        """
+        message = self.client.messages.create(
+            model=model,
+            max_tokens=max_tokens,
+            messages=[
+                {"role": "user", "content": prompt}
+            ]
+        )
+
+        usage = getattr(message, "usage", None)
+        return {
+            "text": message.content[0].text,
+            "input_tokens": usage.input_tokens if usage else 0,
+            "output_tokens": usage.output_tokens if usage else 0
+        }
+
+class RecordingTransport:
+    """Passes requests through to another transport and records the results"""
+
+    def __init__(self, inner, store):
+        self.inner = inner
+        self.store = store
+
+    @property
+    def worst_case_seconds(self):
+        return self.inner.worst_case_seconds
+
+    def send(self, model, prompt, max_tokens):
+        start = time.perf_counter()
+        response = self.inner.send(model, prompt, max_tokens)
+        latency_ms = (time.perf_counter() - start) * 1000
+
+        self.store.add({
+            "key": prompt_key(model, prompt, max_tokens),
+            "model": model,
+            "max_tokens": max_tokens,
+            "prompt_chars": len(prompt),
+            "text": response["text"],
+            "input_tokens": response["input_tokens"],
+            "output_tokens": response["output_tokens"],
+            "latency_ms": round(latency_ms, 1),
+            "recorded_at": datetime.utcnow().isoformat()
+        })
+        return response
+
+class ReplayTransport:
+    """
+    Answers requests from a cassette
+
+    Args:
+        store: CassetteStore to read from
+        latency: None for no delay, a number of seconds for a fixed delay,
+            or "recorded" to sleep for each entry's recorded latency
+        latency_scale: Multiplier applied to the delay (e.g. 0.1 for 10x faster)
+        error_rate: Probability (0-1) of raising InjectedTransportError
+        seed: Seed for the error RNG, for repeatable runs
+    """
+
+    def __init__(self, store, latency=None, latency_scale=1.0, error_rate=0.0, seed=None):
+        self.store = store
+        self.latency = latency
+        self.latency_scale = latency_scale
+        self.error_rate = error_rate
+        self._rng = random.Random(seed)
+        self._rng_lock = threading.Lock()
+
+    def send(self, model, prompt, max_tokens):
+        key = prompt_key(model, prompt, max_tokens)
+        entry = self.store.get(key)
+        if entry is None:
+            raise ReplayMissError(f"No recording for prompt {key} ({len(prompt)} chars) in {self.store.path}")
+
+        delay = self._delay_for(entry)
+        if delay > 0:
+            time.sleep(delay)
+
+        if self.error_rate:
+            with self._rng_lock:
+                fail = self._rng.random() < self.error_rate
+            if fail:
+                raise InjectedTransportError("Injected replay error")
+
+        return {
+            "text": entry["text"],
+            "input_tokens": entry["input_tokens"],
+            "output_tokens": entry["output_tokens"]
+        }
+
+    @property
+    def worst_case_seconds(self):
+        if self.latency == "recorded":
+            slowest = max((e.get("latency_ms", 0) for e in self.store.entries.values()), default=0)
+            return slowest / 1000 * self.latency_scale
+        return self._delay_for({})
+
+    def _delay_for(self, entry):
+        if self.latency is None:
+            return 0
+        if self.latency == "recorded":
+            return entry.get("latency_ms", 0) / 1000 * self.latency_scale
+        return float(self.latency) * self.latency_scale
+
+def summarize_cassette(store):
+    """
+    Aggregate prompt size, token and latency numbers for a cassette
+
+    Useful for comparing two prompt versions recorded against the same flow.
+    """
+    entries = list(store.entries.values())
+    if not entries:
+        return {"calls": 0}
+
+    def mean(field):
+        return round(sum(e.get(field, 0) for e in entries) / len(entries), 1)
+
+    latencies = sorted(e.get("latency_ms", 0) for e in entries)
+    return {
+        "calls": len(entries),
+        "mean_prompt_chars": mean("prompt_chars"),
+        "mean_input_tokens": mean("input_tokens"),
+        "mean_output_tokens": mean("output_tokens"),
+        "mean_latency_ms": mean("latency_ms"),
+        "p95_latency_ms": latencies[min(len(latencies) - 1, int(len(latencies) * 0.95))]
+    }
+
+def transport_from_env():
+    """Build the transport selected by LLM_TRANSPORT / LLM_CASSETTE"""
+    mode = os.getenv('LLM_TRANSPORT', 'live')
+    if mode == 'live':
+        return LiveTransport()
+
+    cassette = os.getenv('LLM_CASSETTE', 'cassettes/coaching.jsonl.gz')
+
+    if mode == 'record':
+        return RecordingTransport(LiveTransport(), CassetteStore(cassette))
+    if mode == 'replay':
+        if not os.path.exists(cassette):
+            # Replaying from an empty store would turn every call into a miss
+            raise FileNotFoundError(f"LLM_TRANSPORT=replay but cassette {cassette} does not exist")
+        latency = os.getenv('LLM_REPLAY_LATENCY')
+        if latency not in (None, '', 'recorded'):
+            latency = float(latency)
+        return ReplayTransport(
+            CassetteStore(cassette),
+            latency=latency or None,
+            latency_scale=float(os.getenv('LLM_REPLAY_LATENCY_SCALE', 1.0)),
+            error_rate=float(os.getenv('LLM_REPLAY_ERROR_RATE', 0.0)),
+            seed=os.getenv('LLM_REPLAY_SEED')
+        )
+
+    raise ValueError(f"Unknown LLM_TRANSPORT: {mode} (expected live, record or replay)")
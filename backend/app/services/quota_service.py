@@ -0,0 +1,189 @@
+import logging
+import os
+import threading
+from datetime import datetime
+from dotenv import load_dotenv
+from app.models.game import PlayerUsage, get_db
+
+load_dotenv()
+
+logger = logging.getLogger(__name__)
+
+class QuotaTracker:
+    """
+    Tracks daily LLM token usage per player.
+
+    Usage is accumulated in memory and written to the player_usage table in
+    batches by a background thread (every `flush_interval` seconds, once
+    start() is called) instead of one DB write per request. Flushes use an
+    additive UPDATE, so several workers can share the same table without
+    overwriting each other's counts.
+
+    record() never touches the database, so a failing flush can't turn an
+    already-paid LLM reply into an error. Counts from a failed flush are kept
+    and retried on the next one.
+    """
+
+    def __init__(self, default_daily_quota=None, flush_interval=None):
+        if default_daily_quota is None:
+            default_daily_quota = int(os.getenv('DAILY_TOKEN_QUOTA', 50000))
+        if flush_interval is None:
+            flush_interval = float(os.getenv('QUOTA_FLUSH_INTERVAL', 30))
+
+        self.default_daily_quota = default_daily_quota
+        self.flush_interval = flush_interval
+        self._pending = {}   # (player_id, day) -> [tokens, requests] not yet written
+        self._flushed = {}   # (player_id, day) -> tokens already in the DB
+        self._inflight = {}  # (player_id, day) -> [tokens, requests] being written right now
+        self._lock = threading.Lock()
+        self._flush_lock = threading.Lock()
+        self._stop = threading.Event()
+        self._thread = None
+
+    def record(self, player_id, tokens):
+        """
+        Add tokens spent by a player to today's counter
+
+        Args:
+            player_id: Player who made the LLM call (None is ignored)
+            tokens: Input + output tokens reported by the API
+        """
+        if player_id is None:
+            return
+
+        key = (player_id, self._today())
+        with self._lock:
+            counts = self._pending.setdefault(key, [0, 0])
+            counts[0] += tokens
+            counts[1] += 1
+
+    def used_today(self, player_id):
+        """Tokens used by a player today, including unflushed usage"""
+        key = (player_id, self._today())
+        with self._lock:
+            flushed = self._flushed.get(key)
+
+        if flushed is None:
+            flushed = self._load_usage(key)
+
+        with self._lock:
+            pending = self._pending.get(key, [0, 0])[0] + self._inflight.get(key, [0, 0])[0]
+        return flushed + pending
+
+    def remaining(self, player_id, daily_quota=None):
+        """Tokens a player may still spend today (never negative)"""
+        quota = daily_quota if daily_quota is not None else self.default_daily_quota
+        return max(0, quota - self.used_today(player_id))
+
+    def start(self):
+        """Start the background flush thread"""
+        if self._thread is not None:
+            return
+
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, name="quota-flush", daemon=True)
+        self._thread.start()
+
+    def stop(self, timeout=None):
+        """Stop the flush thread, writing out anything still pending"""
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join(timeout)
+            self._thread = None
+        self.flush()
+
+    def flush(self):
+        """
+        Write all pending usage to the database in a single transaction
+
+        Returns:
+            True on success (or nothing to write), False if the write failed -
+            failed counts stay pending for the next flush. Never raises.
+        """
+        with self._flush_lock:
+            with self._lock:
+                pending, self._pending = self._pending, {}
+                self._inflight = pending
+
+            if not pending:
+                return True
+
+            db = get_db()
+            try:
+                totals = {}
+                for (player_id, day), (tokens, requests) in pending.items():
+                    updated = db.query(PlayerUsage).filter(
+                        PlayerUsage.player_id == player_id,
+                        PlayerUsage.day == day
+                    ).update({
+                        PlayerUsage.tokens_used: PlayerUsage.tokens_used + tokens,
+                        PlayerUsage.request_count: PlayerUsage.request_count + requests
+                    }, synchronize_session=False)
+
+                    if not updated:
+                        db.add(PlayerUsage(
+                            player_id=player_id,
+                            day=day,
+                            tokens_used=tokens,
+                            request_count=requests
+                        ))
+                        db.flush()
+
+                db.commit()
+
+                # Re-read totals so usage flushed by other workers is picked up
+                for player_id, day in pending:
+                    row = db.query(PlayerUsage).filter(
+                        PlayerUsage.player_id == player_id,
+                        PlayerUsage.day == day
+                    ).first()
+                    totals[(player_id, day)] = row.tokens_used if row else 0
+
+                with self._lock:
+                    self._flushed.update(totals)
+                    self._inflight = {}
+                    self._drop_stale_days()
+                return True
+            except Exception:
+                logger.exception("Could not flush token usage; will retry")
+                db.rollback()
+                # Put the counts back so they're retried on the next flush
+                with self._lock:
+                    self._inflight = {}
+                    for key, (tokens, requests) in pending.items():
+                        counts = self._pending.setdefault(key, [0, 0])
+                        counts[0] += tokens
+                        counts[1] += requests
+                return False
+            finally:
+                db.close()
+
+    def _load_usage(self, key):
+        player_id, day = key
+        db = get_db()
+        try:
+            row = db.query(PlayerUsage).filter(
+                PlayerUsage.player_id == player_id,
+                PlayerUsage.day == day
+            ).first()
+            tokens = row.tokens_used if row else 0
+        finally:
+            db.close()
+
+        with self._lock:
+            self._flushed.setdefault(key, tokens)
+            return self._flushed[key]
+
+    def _drop_stale_days(self):
+        today = self._today()
+        for key in [k for k in self._flushed if k[1] != today]:
+            del self._flushed[key]
+
+    def _run(self):
+        interval = max(self.flush_interval, 0.05)
+        while not self._stop.wait(interval):
+            self.flush()
+
+    @staticmethod
+    def _today():
+        return datetime.utcnow().date()
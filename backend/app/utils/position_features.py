@@ -0,0 +1,303 @@
+"""
+Bitboard-based position features (material, phase, pawn structure,
+king safety, mobility).
+
+Everything is computed from the integer masks `chess.Board` already keeps,
+so no square-by-square scans are needed. Mask arithmetic runs on NumPy
+uint64 arrays, which lets the same code score one position or a whole
+archive of positions at once.
+"""
+import chess
+import numpy as np
+
+PIECE_VALUES = {
+    chess.PAWN: 1,
+    chess.KNIGHT: 3,
+    chess.BISHOP: 3,
+    chess.ROOK: 5,
+    chess.QUEEN: 9,
+}
+
+# Standard tapered-eval weights: full starting material = 24 phase points
+PHASE_WEIGHTS = {
+    chess.KNIGHT: 1,
+    chess.BISHOP: 1,
+    chess.ROOK: 2,
+    chess.QUEEN: 4,
+}
+MAX_PHASE = 24
+
+PHASES = ["opening", "middlegame", "endgame"]
+
+# Phase thresholds (in phase points) shared by classify_phase and classify_phase_batch
+ENDGAME_PHASE_POINTS = 8
+QUEENLESS_ENDGAME_PHASE_POINTS = 12
+OPENING_PHASE_POINTS = 20
+OPENING_MAX_FULLMOVE = 10
+
+FEATURE_NAMES = [
+    "material_white",
+    "material_black",
+    "material_balance",      # white minus black, in pawns
+    "phase_points",          # 0 (bare kings/pawns) .. 24 (all pieces)
+    "phase_score",           # phase_points / 24, 1.0 = full material
+    "queens",                # queens left on the board (both sides)
+    "doubled_pawns_white",
+    "doubled_pawns_black",
+    "isolated_pawns_white",
+    "isolated_pawns_black",
+    "passed_pawns_white",
+    "passed_pawns_black",
+    "king_shield_white",     # own pawns on the 2 ranks in front of the king
+    "king_shield_black",
+    "king_open_files_white",  # files around the king with no own pawns
+    "king_open_files_black",
+    "king_attackers_white",  # enemy pieces hitting the king zone
+    "king_attackers_black",
+    "mobility_white",        # squares reachable by non-pawn, non-king pieces
+    "mobility_black",
+]
+
+_U = np.uint64
+_ALL = _U(chess.BB_ALL)
+_FILES = np.array(chess.BB_FILES, dtype=np.uint64)
+_NOT_FILE_A = _U(chess.BB_ALL & ~chess.BB_FILE_A)
+_NOT_FILE_H = _U(chess.BB_ALL & ~chess.BB_FILE_H)
+
+# Byte popcount lookup - works on any NumPy version
+_POPCOUNT8 = np.array([bin(i).count("1") for i in range(256)], dtype=np.uint8)
+
+
+def _build_king_tables():
+    """Per-square pawn-shield masks, and which files are next to a king on that square"""
+    shield = np.zeros((2, 64), dtype=np.uint64)
+    files = np.zeros((64, 8), dtype=bool)
+
+    for sq in chess.SQUARES:
+        f = chess.square_file(sq)
+        r = chess.square_rank(sq)
+        near_files = [x for x in (f - 1, f, f + 1) if 0 <= x < 8]
+
+        files[sq, near_files] = True
+
+        for color, step in ((chess.WHITE, 1), (chess.BLACK, -1)):
+            mask = 0
+            for dr in (1, 2):
+                rank = r + step * dr
+                if 0 <= rank < 8:
+                    for x in near_files:
+                        mask |= chess.BB_SQUARES[chess.square(x, rank)]
+            shield[int(color)][sq] = _U(mask)
+
+    return shield, files
+
+
+_KING_SHIELD, _KING_FILES = _build_king_tables()
+
+
+def _popcount(arr):
+    """Vectorized popcount of a uint64 array"""
+    arr = np.ascontiguousarray(arr)
+    return _POPCOUNT8[arr.view(np.uint8)].reshape(arr.shape + (8,)).sum(axis=-1, dtype=np.int64)
+
+
+def _south_fill(bb):
+    bb = bb | (bb >> _U(8))
+    bb = bb | (bb >> _U(16))
+    return bb | (bb >> _U(32))
+
+
+def _north_fill(bb):
+    bb = bb | ((bb << _U(8)) & _ALL)
+    bb = bb | ((bb << _U(16)) & _ALL)
+    return bb | ((bb << _U(32)) & _ALL)
+
+
+def _spread(bb):
+    """A mask plus its neighbours on the adjacent files"""
+    return bb | ((bb << _U(1)) & _NOT_FILE_A) | ((bb >> _U(1)) & _NOT_FILE_H)
+
+
+def _lsb_index(bb):
+    """Square index of single-bit masks (0 for empty masks)"""
+    out = np.zeros(bb.shape, dtype=np.int64)
+    nonzero = bb != 0
+    # Powers of two are exact in float64, so log2 is exact here
+    out[nonzero] = np.log2(bb[nonzero].astype(np.float64)).astype(np.int64)
+    return out
+
+
+def _pawn_structure(pawns, file_counts):
+    """
+    Doubled, isolated and passed pawn counts for both colors
+
+    Args:
+        pawns: (2, n) pawn masks indexed by color
+        file_counts: (2, n, 8) pawns per file
+    """
+    doubled = np.clip(file_counts - 1, 0, None).sum(axis=-1)
+
+    occupied = file_counts > 0
+    neighbours = np.zeros_like(occupied)
+    neighbours[..., 1:] |= occupied[..., :-1]
+    neighbours[..., :-1] |= occupied[..., 1:]
+    isolated = np.where(neighbours, 0, file_counts).sum(axis=-1)
+
+    # Squares where an enemy pawn in front (same or adjacent file) can stop a pawn
+    w, b = int(chess.WHITE), int(chess.BLACK)
+    stopped = np.empty_like(pawns)
+    stopped[w] = _spread(_south_fill(pawns[b] >> _U(8)))
+    stopped[b] = _spread(_north_fill((pawns[w] << _U(8)) & _ALL))
+    passed = _popcount(pawns & ~stopped & _ALL)
+
+    return doubled, isolated, passed
+
+
+def _attack_features(board):
+    """
+    Mobility and king-zone attackers for both sides in one pass over the pieces
+
+    Returns:
+        (mobility_white, mobility_black, attackers_on_white_king, attackers_on_black_king)
+    """
+    occupied_co = board.occupied_co
+    zones = {}
+    for color in chess.COLORS:
+        king = board.king(color)
+        zones[color] = 0 if king is None else chess.BB_KING_ATTACKS[king] | chess.BB_SQUARES[king]
+
+    mobility = {chess.WHITE: 0, chess.BLACK: 0}
+    attackers = {chess.WHITE: 0, chess.BLACK: 0}
+
+    for sq, piece in board.piece_map().items():
+        attacks = board.attacks_mask(sq)
+        color = piece.color
+
+        if piece.piece_type not in (chess.PAWN, chess.KING):
+            mobility[color] += chess.popcount(attacks & ~occupied_co[color])
+
+        if attacks & zones[not color]:
+            attackers[not color] += 1
+
+    return mobility[chess.WHITE], mobility[chess.BLACK], attackers[chess.WHITE], attackers[chess.BLACK]
+
+
+def extract_features_batch(boards):
+    """
+    Compute features for many positions at once
+
+    Args:
+        boards: Iterable of chess.Board objects or FEN strings
+
+    Returns:
+        float64 array of shape (n_positions, len(FEATURE_NAMES))
+    """
+    boards = [chess.Board(b) if isinstance(b, str) else b for b in boards]
+    n = len(boards)
+    if n == 0:
+        return np.zeros((0, len(FEATURE_NAMES)))
+
+    # Gather raw bitboards: masks[color, piece_type - 1, position]
+    masks = np.empty((2, 6, n), dtype=np.uint64)
+    attack = np.empty((n, 4), dtype=np.int64)
+    for i, board in enumerate(boards):
+        for color in chess.COLORS:
+            occ = board.occupied_co[color]
+            c = int(color)
+            masks[c, 0, i] = board.pawns & occ
+            masks[c, 1, i] = board.knights & occ
+            masks[c, 2, i] = board.bishops & occ
+            masks[c, 3, i] = board.rooks & occ
+            masks[c, 4, i] = board.queens & occ
+            masks[c, 5, i] = board.kings & occ
+        attack[i] = _attack_features(board)
+
+    counts = _popcount(masks)  # (2, 6, n)
+    values = np.array([PIECE_VALUES.get(pt, 0) for pt in chess.PIECE_TYPES])
+    weights = np.array([PHASE_WEIGHTS.get(pt, 0) for pt in chess.PIECE_TYPES])
+
+    material = np.einsum("cpn,p->cn", counts, values)
+    phase_points = np.minimum(np.einsum("cpn,p->n", counts, weights), MAX_PHASE)
+
+    w, b = int(chess.WHITE), int(chess.BLACK)
+    pawns = masks[:, 0]
+    file_counts = _popcount(pawns[..., None] & _FILES)  # (2, n, 8)
+    doubled, isolated, passed = _pawn_structure(pawns, file_counts)
+
+    king_sq = _lsb_index(masks[:, 5])  # (2, n)
+    shield = _popcount(pawns & _KING_SHIELD[np.arange(2)[:, None], king_sq])
+    open_files = ((file_counts == 0) & _KING_FILES[king_sq]).sum(axis=-1)
+
+    columns = [
+        material[w],
+        material[b],
+        material[w] - material[b],
+        phase_points,
+        phase_points / MAX_PHASE,
+        counts[w, 4] + counts[b, 4],
+        doubled[w],
+        doubled[b],
+        isolated[w],
+        isolated[b],
+        passed[w],
+        passed[b],
+        shield[w],
+        shield[b],
+        open_files[w],
+        open_files[b],
+        attack[:, 2],
+        attack[:, 3],
+        attack[:, 0],
+        attack[:, 1],
+    ]
+    return np.column_stack(columns).astype(np.float64)
+
+
+def extract_features(board):
+    """
+    Compute features for a single position
+
+    Returns:
+        dict mapping each name in FEATURE_NAMES to a number
+    """
+    row = extract_features_batch([board])[0]
+    features = {name: int(value) for name, value in zip(FEATURE_NAMES, row)}
+    features["phase_score"] = round(float(row[FEATURE_NAMES.index("phase_score")]), 3)
+    return features
+
+
+def classify_phase(features, fullmove_number):
+    """
+    Map features to "opening", "middlegame" or "endgame"
+
+    Uses the tapered phase score instead of a raw piece count, so a position
+    with queens off and only a few pieces left is an endgame even when many
+    pawns remain, and an early queen trade doesn't keep it an "opening".
+    """
+    phase_points = features["phase_points"]
+
+    if phase_points <= ENDGAME_PHASE_POINTS or (
+            features["queens"] == 0 and phase_points <= QUEENLESS_ENDGAME_PHASE_POINTS):
+        return "endgame"
+    if fullmove_number <= OPENING_MAX_FULLMOVE and phase_points >= OPENING_PHASE_POINTS:
+        return "opening"
+    return "middlegame"
+
+
+def classify_phase_batch(features, fullmove_numbers):
+    """
+    Vectorized classify_phase over rows from extract_features_batch
+
+    Returns:
+        int array of indexes into PHASES
+    """
+    phase_points = features[:, FEATURE_NAMES.index("phase_points")]
+    queens = features[:, FEATURE_NAMES.index("queens")]
+    fullmove_numbers = np.asarray(fullmove_numbers)
+
+    codes = np.full(len(features), PHASES.index("middlegame"))
+    codes[(fullmove_numbers <= OPENING_MAX_FULLMOVE) & (phase_points >= OPENING_PHASE_POINTS)] = PHASES.index("opening")
+    endgame = (phase_points <= ENDGAME_PHASE_POINTS) | (
+        (queens == 0) & (phase_points <= QUEENLESS_ENDGAME_PHASE_POINTS))
+    codes[endgame] = PHASES.index("endgame")
+    return codes
@@ -0,0 +1,84 @@
+import threading
+import time
+from collections import OrderedDict
+
+
+class TokenBucket:
+    """
+    Classic token bucket: holds up to `capacity` tokens and refills at
+    `refill_rate` tokens per second. Each request spends one token.
+    """
+
+    def __init__(self, capacity, refill_rate, now=None):
+        self.capacity = capacity
+        self.refill_rate = refill_rate
+        self.tokens = float(capacity)
+        self.updated_at = time.monotonic() if now is None else now
+
+    def consume(self, now, amount=1):
+        """
+        Try to spend `amount` tokens
+
+        Returns:
+            (allowed, retry_after) - retry_after is seconds until enough
+            tokens will be available (0 when allowed)
+        """
+        elapsed = now - self.updated_at
+        self.tokens = min(self.capacity, self.tokens + elapsed * self.refill_rate)
+        self.updated_at = now
+
+        if self.tokens >= amount:
+            self.tokens -= amount
+            return True, 0
+
+        retry_after = (amount - self.tokens) / self.refill_rate
+        return False, retry_after
+
+
+class RateLimiter:
+    """
+    In-memory token-bucket rate limiter keyed by an arbitrary string
+    (e.g. "player:12" or "ip:10.0.0.1").
+
+    State lives in the worker process, so limits are per worker. Buckets
+    are kept in least-recently-used order and the oldest is evicted once
+    `max_keys` is reached, so a flood of unique keys can't grow memory
+    without bound and each new key costs O(1).
+    """
+
+    def __init__(self, requests_per_minute=20, burst=5, max_keys=10000):
+        self.capacity = burst
+        self.refill_rate = requests_per_minute / 60.0
+        self.max_keys = max_keys
+        self._buckets = OrderedDict()
+        self._lock = threading.Lock()
+
+    def check(self, key):
+        """
+        Spend one token for `key`
+
+        Returns:
+            (allowed, retry_after_seconds)
+        """
+        now = time.monotonic()
+        with self._lock:
+            bucket = self._buckets.get(key)
+            if bucket is None:
+                while len(self._buckets) >= self.max_keys:
+                    # Evicting forgets that key's history, i.e. it starts a
+                    # fresh (full) bucket if it comes back
+                    self._buckets.popitem(last=False)
+                bucket = TokenBucket(self.capacity, self.refill_rate, now)
+                self._buckets[key] = bucket
+            else:
+                self._buckets.move_to_end(key)
+            return bucket.consume(now)
+
+    def reset(self, key=None):
+        """Forget one key's bucket, or all buckets when key is None"""
+        with self._lock:
+            if key is None:
+                self._buckets.clear()
+            else:
+                self._buckets.pop(key, None)
+
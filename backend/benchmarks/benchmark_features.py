@@ -0,0 +1,73 @@
+"""
+Throughput benchmark for the position feature extractor
+
+Usage (from backend/):
+    python benchmarks/benchmark_features.py [--positions 20000] [--batch-size 1000]
+"""
+import argparse
+import os
+import random
+import sys
+import time
+
+# Add backend to path
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import chess
+from app.utils.position_features import extract_features, extract_features_batch
+
+
+def random_positions(count, seed=0):
+    """Positions from seeded random games, so runs are comparable"""
+    rng = random.Random(seed)
+    positions = []
+    while len(positions) < count:
+        board = chess.Board()
+        for _ in range(rng.randint(10, 120)):
+            moves = list(board.legal_moves)
+            if not moves:
+                break
+            board.push(rng.choice(moves))
+            positions.append(board.copy(stack=False))
+    return positions[:count]
+
+
+def timed(fn):
+    start = time.perf_counter()
+    fn()
+    return time.perf_counter() - start
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--positions', type=int, default=20000)
+    parser.add_argument('--batch-size', type=int, default=1000)
+    args = parser.parse_args()
+
+    positions = random_positions(args.positions)
+    fens = [board.fen() for board in positions]
+    print(f"Benchmarking {len(positions)} positions\n")
+
+    def single():
+        for board in positions:
+            extract_features(board)
+
+    def batched():
+        for i in range(0, len(positions), args.batch_size):
+            extract_features_batch(positions[i:i + args.batch_size])
+
+    def batched_fens():
+        for i in range(0, len(fens), args.batch_size):
+            extract_features_batch(fens[i:i + args.batch_size])
+
+    for label, fn in [
+        ("extract_features (one at a time)", single),
+        (f"extract_features_batch (boards, batch={args.batch_size})", batched),
+        (f"extract_features_batch (FENs, batch={args.batch_size})", batched_fens),
+    ]:
+        elapsed = timed(fn)
+        print(f"{label:<50} {len(positions) / elapsed:>10,.0f} positions/sec")
+
+
+if __name__ == '__main__':
+    main()
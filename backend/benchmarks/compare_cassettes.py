@@ -0,0 +1,39 @@
+"""
+Compare prompt size, token usage and latency between two LLM cassettes
+
+Record the same coaching flow with LLM_TRANSPORT=record against two
+versions of the prompts, then:
+    python benchmarks/compare_cassettes.py old.jsonl.gz new.jsonl.gz
+"""
+import argparse
+import os
+import sys
+
+# Add backend to path
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from app.services.llm_transport import CassetteStore, summarize_cassette
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('baseline')
+    parser.add_argument('candidate')
+    args = parser.parse_args()
+
+    for path in (args.baseline, args.candidate):
+        if not os.path.exists(path):
+            parser.error(f"cassette not found: {path}")
+
+    before = summarize_cassette(CassetteStore(args.baseline))
+    after = summarize_cassette(CassetteStore(args.candidate))
+
+    print(f"{'metric':<22} {'baseline':>12} {'candidate':>12} {'change':>10}")
+    for metric in before:
+        old, new = before[metric], after.get(metric, 0)
+        change = f"{(new - old) / old * 100:+.1f}%" if old else "n/a"
+        print(f"{metric:<22} {old:>12} {new:>12} {change:>10}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,133 @@
+"""
+Concurrency stress test for ChessService
+
+Hammers one game from several threads with moves, undos and atomic batches
+(some deliberately invalid), checking board invariants as it goes.
+Exits non-zero if any invariant is violated.
+
+Usage (from backend/):
+    python benchmarks/stress_game_mutations.py [--threads 8] [--ops 500]
+"""
+import argparse
+import os
+import random
+import sys
+import threading
+
+# Add backend to path
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import chess
+from app.services.chess_service import ChessService
+
+
+def check_invariants(service):
+    """Return a list of problems with the game state (empty when consistent)"""
+    problems = []
+    with service.lock:
+        board = service.board.copy()
+        moves = list(service.moves)
+
+    if len(moves) != len(board.move_stack):
+        problems.append(f"{len(moves)} SAN moves but {len(board.move_stack)} moves on the board")
+
+    replay = chess.Board()
+    try:
+        for san in moves:
+            replay.push_san(san)
+    except ValueError as e:
+        problems.append(f"SAN history doesn't replay: {e}")
+        return problems
+
+    if replay.fen() != board.fen():
+        problems.append(f"replayed FEN {replay.fen()} != board FEN {board.fen()}")
+    if not board.is_valid():
+        problems.append(f"invalid board: {board.fen()}")
+
+    return problems
+
+
+def worker(service, ops, seed, errors):
+    rng = random.Random(seed)
+    for _ in range(ops):
+        roll = rng.random()
+
+        if roll < 0.02:
+            service.reset_board()
+
+        elif roll < 0.45:
+            with service.lock:
+                legal = [service.board.san(m) for m in service.board.legal_moves]
+            if legal:
+                # The position may change before we move; an invalid move is fine
+                service.make_move(rng.choice(legal))
+            else:
+                service.reset_board()
+
+        elif roll < 0.75:
+            service.undo_last_move()
+
+        else:
+            # Build a short batch from a private copy, sometimes poisoned
+            with service.lock:
+                probe = service.board.copy()
+            batch = []
+            for _ in range(rng.randint(1, 4)):
+                legal = list(probe.legal_moves)
+                if not legal:
+                    break
+                move = rng.choice(legal)
+                batch.append(probe.san(move))
+                probe.push(move)
+            if rng.random() < 0.3:
+                batch.append("Zz9")
+
+            # Hold the lock around the batch only to measure it; make_moves
+            # is atomic on its own
+            with service.lock:
+                before = list(service.moves)
+                result = service.make_moves(batch)
+                after = list(service.moves)
+            if not result['success'] and after != before:
+                errors.append(f"failed batch changed history from {len(before)} to {len(after)} moves")
+
+        problems = check_invariants(service)
+        if problems:
+            errors.extend(problems)
+            return
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--threads', type=int, default=8)
+    parser.add_argument('--ops', type=int, default=500, help='operations per thread')
+    parser.add_argument('--seed', type=int, default=0)
+    args = parser.parse_args()
+
+    # Switch threads often to maximise interleaving
+    sys.setswitchinterval(1e-5)
+
+    service = ChessService()
+    errors = []
+    threads = [
+        threading.Thread(target=worker, args=(service, args.ops, args.seed + i, errors))
+        for i in range(args.threads)
+    ]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+
+    errors.extend(check_invariants(service))
+    total = args.threads * args.ops
+    if errors:
+        print(f"FAILED after {total} operations:")
+        for error in errors[:20]:
+            print(f"  - {error}")
+        sys.exit(1)
+
+    print(f"OK: {total} operations across {args.threads} threads, final position {service.board.fen()}")
+
+
+if __name__ == '__main__':
+    main()
@@ -37,6 +37,13 @@ init_db()
 from app.routes.game_routes import game_bp
 app.register_blueprint(game_bp, url_prefix='/api/game')
 
+# Start background post-game analysis workers (ANALYSIS_WORKERS=0 to disable,
+# e.g. when running analysis_worker.py as a separate process)
+from app.routes.game_routes import analysis_queue, quota_tracker
+analysis_queue.start()
+# Periodically flush batched token-usage counters
+quota_tracker.start()
+
 # Security Fix #3: Add security headers
 @app.after_request
 def add_security_headers(response):